@@ -1,16 +1,19 @@
 ########### PYTHON
-# Script Title: Anthropic PDF Renamer (v0.6 - Refactored)
-# Script Description: Auto-renames PDFs in a directory by extracting first-page text, leveraging Anthropic's Claude Haiku model to infer author/title/pubdate, renaming files, and updating PDF metadata accordingly. Rewrites, extension, and clarity improvements per modern Python and systems best practice.
+# Script Title: Anthropic PDF Renamer (v0.7 - Concurrent & Cached)
+# Script Description: Auto-renames PDFs in a directory by reading trusted embedded metadata or, failing that, extracting first-pages text and leveraging Anthropic's Claude Haiku model to infer author/title/pubdate, renaming files, and updating PDF metadata accordingly. Extraction, batched LLM calls and a persistent answer cache are pipelined for throughput on large directories.
 # Script Author: myPyAI + Naveen Srivatsav
-# Last Updated: 20240604
+# Last Updated: 20261014
 # TLA+ Abstract:
 # """
 # tla ---- MODULE pdf_renamer ----
 # VARIABLES pdf_files, extracted_text, ai_metadata, renamed_files
 # Init == pdf_files \in Directory /\ extracted_text = <<>> /\ ai_metadata = <<>> /\ renamed_files = {}
 # Next == \E file \in pdf_files:
-#      /\ extracted_text' = extract_first_page(file)
-#      /\ ai_metadata' = query_llm(extracted_text)
+#      /\ IF TrustedMetadata(file) THEN
+#            ai_metadata' = embedded_metadata(file)
+#         ELSE
+#            /\ extracted_text' = extract_first_pages(file)
+#            /\ ai_metadata' = IF Cached(extracted_text') THEN cache(extracted_text') ELSE query_llm(extracted_text')
 #      /\ IF Valid(ai_metadata') THEN
 #            renamed_files' = Renamed(renamed_files, file, ai_metadata')
 #         ELSE
@@ -18,149 +21,442 @@
 # Success == \A f \in pdf_files: FileIsNamedAndTagged(f)
 # ----
 # """
-# Major changes: 
-# - Further modularization for clarity and testability
-# - All I/O and side-effects managed in main()
-# - More robust error handling and reporting
-# - Clean separation of LLM querying, text extraction, metadata processing, and renaming
-# - Extensible design; easy to plug in other LLMs, PDF libraries, or naming policies
-# - Uses pathlib for safer path operations and better cross-OS support
+# Major changes:
+# - Concurrent AsyncAnthropic calls behind a semaphore and requests/tokens-per-minute token bucket
+# - Transient API errors retried with jittered exponential backoff; per-request timeout
+# - Several PDFs per request, with structured output via forced tool use (answers matched by document number)
+# - SQLite cache of answers by text hash, plus MinHash LSH reuse for near-duplicate text (llm_cache.py)
+# - Prompt-cached system block; extracted text capped at MAX_PROMPT_CHARS
+# - pypdfium2 extraction in a process pool, pipelined with the LLM workers; PDFs with trusted metadata skip the LLM
+# - pikepdf in-place metadata update + rename; already-named files are left alone on re-runs
+# - Heavy third-party imports deferred so startup and input validation stay fast
 ###########
 
-# To run: pip install anthropic PyPDF2 python-dotenv
+# To run: pip install anthropic datasketch pikepdf pypdfium2 python-dotenv tenacity
+from __future__ import annotations  # Annotations stay unevaluated, so lazily imported types can be used in hints
 import os  # Standard: Directory listing, env var fallback
-import re  # Standard: String sanitization
-import json  # Standard: Parsing LLM responses, file-safe serialization
+import re  # Standard: PDF date parsing
+import time  # Standard: Monotonic clock for rate limiting
+import asyncio  # Standard: Concurrent LLM requests
+from concurrent.futures import ProcessPoolExecutor  # Standard: Parallel text extraction across cores
 from pathlib import Path  # Standard: Modern path handling replaces os.path
-from typing import Optional, Dict  # Standard: Type hints for maintainability
+from typing import TYPE_CHECKING, Optional, Dict, List, Tuple  # Standard: Type hints for maintainability
+
+# Third-party: Deep dependency. The heavy ones (anthropic, pikepdf, pypdfium2, python-dotenv) are imported
+# inside the functions that use them, so CLI startup and input validation don't pay ~1.5s of imports, and
+# extraction worker processes never load the API client at all.
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential  # Backoff
+
+if TYPE_CHECKING:
+    import pypdfium2 as pdfium
+    from anthropic import AsyncAnthropic
+    from tenacity import RetryCallState
 
-# Third-party: Deep dependency
-from anthropic import Anthropic         # LLM API client
-from PyPDF2 import PdfReader, PdfWriter # PDF operations
-from dotenv import load_dotenv          # Secure .env configuration
+# Local
+from llm_cache import LLMCache, cache_key, text_minhash  # Persistent exact + near-duplicate cache of LLM guesses
 
 # INGREDIENTS:
-# - Standard: os, re, json, pathlib, typing
-# - Third-party: anthropic, PyPDF2, python-dotenv
+# - Standard: os, re, time, asyncio, concurrent.futures, pathlib, typing
+# - Third-party: anthropic, pikepdf, pypdfium2, python-dotenv, tenacity
+# - Local: llm_cache (sqlite3 + datasketch)
+
+# Throughput limits; keep below your Anthropic account tier.
+MAX_CONCURRENT_REQUESTS = 8
+MAX_REQUESTS_PER_MINUTE = 50
+MAX_TOKENS_PER_MINUTE = 50_000
+# Per-request timeout; generous because one request may carry a full batch of PDFs.
+REQUEST_TIMEOUT_SECONDS = 60.0
+MAX_OUTPUT_TOKENS_PER_DOC = 200
+# Several PDFs share one request; 20 docs * 200 output tokens stays under Haiku's 4096-token output cap.
+MAX_BATCH_SIZE = 20
+# Cap on extracted text sent per PDF (~2K tokens); title/author/date live in the first pages anyway.
+MAX_PROMPT_CHARS = 8000
+
+# Cache-key salt for LLM guesses; bump whenever SYSTEM_PROMPT, METADATA_TOOL, USER_MSG or the model change.
+PROMPT_VERSION = "v5"
+
+# Static instructions + few-shot examples. Kept byte-identical across calls and sent as a
+# cache_control block so Anthropic's prompt cache serves it for the whole directory run.
+SYSTEM_PROMPT = (
+    "You are an expert librarian specializing in digital knowledge management, renowned for your meticulous approach to naming, organizing, and ensuring the discoverability of electronic resources. In your process, you practice analytical cross-referencing, triangulating key bibliographic details from multiple points within a document (title page, copyright, TOC, citation instructions). Your philosophy is driven by optimally balancing user searchability (discoverability), source traceability (sourceability), and archival order. You bring a systems view: every filename you craft is an intentional node in a vast, navigable digital knowledge ecosystem, shaped to maximize both present retrieval and future relevance."
+    "Upon receiving the first ten pages of raw text from a PDF, your task is to accurately infer and assemble three bibliographic details for effective PDF file naming:"
+    "Title: Extract the complete, official title (including subtitle), prioritizing accuracy and specificity. Cross-check its consistency by locating it on the title page, copyright page, table of contents, and in citation guidance sections."
+    "Author/Institution: Determine the primary institution(s) or lead author(s). Give preference to institutional names over individuals. If multiple institutions are listed, include a maximum of three (joined by \"&\"). For individual authors in journal papers, use the lead author’s name followed by \"etal\" if appropriate."
+    "Year of Publication: Infer the most likely year (including month if present for increased precision), also validated across several mentions in the document."
+    "Structure the filename as: [Institution(s) or Author] - [Full Title] ([Year])"
+    "Example: OECD & MissionLab - Harnessing mission governance to achieve national climate targets (2025)"
+    "Prioritize institutions and specifically use their most recognisable acronyms. Only use individual names if institutions are unclear/not primary."
+    "For single- or dual-author papers, include the full name(s); for three or more authors, use the lead name and \"etal\"."
+    "Month or season in the date is included if available, else use just the year."
+    "Always use an ampersand (&) to separate institutions (max of 3) and 'etal' to indicate multiple authors after only naming one author in the title."
+    "If unclear, suggest author as Various and Title as Unknown."
+    "Here are 10 examples of how I want titles to be structured:"
+    "SpringerOpen - African Handbook of Climate Change Adaptation (2022)"
+    "GIZ & NCFA & UNEP-FI & Global Canopy & Emerging Markets Dialogu - making FIs more resilient to environmental risks (Apr, 2017)"
+    "NBER - Adapting To Flood Risk Evidence From A Panel Of Global Cities (2022)"
+    "Gaby Frangieh - Credit spread risk in the banking book (2025)"
+    "Banca d'Italia & IMF - Embedding sustainability in credit risk assessment (Mar, 2025)"
+    "Augusto Blanc-Blocquel etal - Climate-related default probabilities (2024)"
+    "Misereor - Towards a socio-ecological transformation of the economy (Mar, 2024)"
+    "Esther Shears etal - How central banks manage climate and energy transition risks (Feb, 2025)"
+    "OECD & ColumbiaU - Harnessing mission governance to achieve national climate targets (2025)"
+    "OxfordU - Input for the update of the SBTi corporate net-zero standard (April, 2025)"
+    "Put simply, your guess should look like this: OrgA & OrgB & Jane Smith - The Document Title- Subtitles (2023)."
+    "Record your answer with the emit_metadata tool: one entry (document number, author, title, pubdate) per document."
+)
+SYSTEM_BLOCKS = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+
+# Document text per request: one batch must fit in the tokens/min bucket next to the system prompt and output budget,
+# otherwise RateLimiter.acquire() could never grant it. Only binds when MAX_TOKENS_PER_MINUTE is lowered.
+MAX_BATCH_INPUT_TOKENS = (
+    MAX_TOKENS_PER_MINUTE - len(SYSTEM_PROMPT) // 4 - MAX_OUTPUT_TOKENS_PER_DOC * MAX_BATCH_SIZE
+)
+
+# Structured output via forced tool use; Claude returns schema-shaped JSON instead of free text.
+METADATA_TOOL = {
+    "name": "emit_metadata",
+    "description": "Record the inferred bibliographic metadata for each document, tagged with its document number.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "documents": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "document": {"type": "integer", "description": "Number N from the 'Document N:' header."},
+                        "author": {"type": "string"},
+                        "title": {"type": "string"},
+                        "pubdate": {"type": "string"},
+                    },
+                    "required": ["document", "author", "title", "pubdate"],
+                },
+            },
+        },
+        "required": ["documents"],
+    },
+}
+
+# Precompiled pattern for PDF date parsing
+_PDF_DATE_YEAR = re.compile(r"^(?:D:)?(\d{4})")
+
+# Placeholder values PDF producers leave in /Author or /Title (Office defaults, OS account names); never trusted as
+# real metadata. Matched against the whole sanitized value, so real titles that merely contain these words still pass.
+_JUNK_METADATA = re.compile(
+    r"untitled\s*\d*|unknown|anonymous|document\s*\d*|slide\s*\d+|presentation\s*\d*|book\s*\d+"
+    r"|(microsoft\s+)?(office|word|excel|powerpoint)(\s+(document|presentation))?"
+    r"|microsoft\s+(office\s+)?(word|excel|powerpoint)\s+-.*"
+    r"|(windows\s+)?(admin|administrator|user|owner|guest)",
+    re.IGNORECASE,
+)
+# Titles that are just the source file's name (e.g. "report_final.docx") rather than a real title
+_FILENAME_TITLE = re.compile(r"\.(?:docx?|pptx?|xlsx?|pdf|rtf|odt|txt|tex|indd)\b", re.IGNORECASE)
 
-def load_llm(api_key_env_var: str = "ANTHROPIC_API_KEY") -> Anthropic:
+class _FilenameCharTable(dict):
     """
-    Big-picture: Initialize and return Anthropic client using secure API key lookup, with .env fallback.
+    Big-picture: str.translate() table keeping letters, digits, whitespace, and _ ( ) - &; deletes everything else.
+    Inputs: Unicode code points, looked up by str.translate().
+    Outputs: The code point itself (keep) or None (delete).
+    Role: Single C-level pass for sanitize_filename(); entries are computed on first sight instead of precomputing all of Unicode.
+    """
+    def __missing__(self, codepoint: int) -> Optional[int]:
+        char = chr(codepoint)
+        keep = char.isalnum() or char.isspace() or char in "_()-&"
+        self[codepoint] = codepoint if keep else None
+        return self[codepoint]
+
+_FILENAME_CHARS = _FilenameCharTable()
+
+class RateLimiter:
+    """
+    Big-picture: Token-bucket limiter for requests/min and tokens/min, shared by all concurrent LLM calls.
+    Inputs: requests_per_minute, tokens_per_minute - bucket capacities, refilled continuously.
+    Outputs: acquire() returns once capacity for one request of the given token cost is available.
+    Role: Keeps the parallel driver under API rate limits (after Anthropic's parallel request processor cookbook).
+    """
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.max_requests = float(requests_per_minute)
+        self.max_tokens = float(tokens_per_minute)
+        self.available_requests = self.max_requests
+        self.available_tokens = self.max_tokens
+        self.last_update = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        """
+        Big-picture: Top up both buckets in proportion to the time elapsed since the last refill, capped at capacity.
+        Inputs: None (reads the monotonic clock).
+        Outputs: None (updates available_requests, available_tokens, last_update).
+        Role: Continuous refill, so capacity frees up smoothly instead of resetting once a minute.
+        """
+        now = time.monotonic()
+        elapsed = now - self.last_update
+        self.available_requests = min(self.max_requests, self.available_requests + elapsed * self.max_requests / 60)
+        self.available_tokens = min(self.max_tokens, self.available_tokens + elapsed * self.max_tokens / 60)
+        self.last_update = now
+
+    async def acquire(self, token_cost: int) -> None:
+        """
+        Big-picture: Wait until one request and token_cost tokens are available, then take them.
+        Inputs: token_cost - estimated input + output tokens; values above tokens_per_minute are capped to a full bucket.
+        Outputs: None (returns once capacity is granted).
+        Role: Sleeps while holding the lock, so later callers queue behind the current waiter (first-come, first-served
+        and no thundering herd); the cap keeps an oversized request from waiting forever.
+        """
+        token_cost = min(float(token_cost), self.max_tokens)  # Oversized requests wait for a full bucket
+        async with self._lock:  # Serialize waiters so capacity is granted first-come, first-served
+            while True:
+                self._refill()
+                if self.available_requests >= 1 and self.available_tokens >= token_cost:
+                    self.available_requests -= 1
+                    self.available_tokens -= token_cost
+                    return
+                wait = max(
+                    (1 - self.available_requests) * 60 / self.max_requests,
+                    (token_cost - self.available_tokens) * 60 / self.max_tokens,
+                )
+                await asyncio.sleep(wait)
+
+def load_llm(api_key_env_var: str = "ANTHROPIC_API_KEY") -> AsyncAnthropic:
+    """
+    Big-picture: Initialize and return async Anthropic client using secure API key lookup, with .env fallback.
     Inputs: api_key_env_var - name of environment variable containing API key.
-    Outputs: Anthropic client object.
+    Outputs: AsyncAnthropic client object.
     Role: Dependency management and setup.
     """
+    from dotenv import load_dotenv  # Secure .env configuration
+    from anthropic import AsyncAnthropic  # LLM API client (async)
     load_dotenv()
     api_key = os.getenv(api_key_env_var)
     if not api_key:
         raise RuntimeError("Anthropic API key is missing. Please set the ANTHROPIC_API_KEY environment variable or .env file.")
-    return Anthropic(api_key=api_key)
+    # Retries are handled by tenacity in create_message(), so disable the SDK's own retry loop.
+    return AsyncAnthropic(api_key=api_key, max_retries=0, timeout=REQUEST_TIMEOUT_SECONDS)
 
-def extract_first_n_pages_text(pdf_path: Path, n: int = 5) -> Optional[str]:
+def extract_first_n_pages_text(pdf: pdfium.PdfDocument, n: int = 5) -> Optional[str]:
     """
-    Big-picture: Extract text content from the first n pages of a PDF (no OCR, only text PDF).
-    Inputs: pdf_path - Path to PDF file; n - number of pages to extract.
-    Outputs: Extracted text string, or None on failure.
+    Big-picture: Extract text content from the first n pages of a PDF (no OCR, only text PDF), capped at MAX_PROMPT_CHARS.
+    Inputs: pdf - already-opened PDFium document; n - maximum number of pages to extract.
+    Outputs: Extracted text string, or None if no text was found.
     Role: Provides "raw" string for LLM analysis.
     """
+    texts = []
+    total_chars = 0
+    for i in range(min(len(pdf), n)):
+        # PDFium (C++) text extraction; returns CRLF line breaks
+        page_text = pdf[i].get_textpage().get_text_range().replace("\r\n", "\n").strip()
+        if page_text:
+            texts.append(page_text)
+            total_chars += len(page_text) + 2
+            if total_chars >= MAX_PROMPT_CHARS:
+                break  # Later pages would be truncated away; don't extract them
+    return "\n\n".join(texts)[:MAX_PROMPT_CHARS] if texts else None
+
+def read_existing_metadata(pdf: pdfium.PdfDocument) -> Optional[Dict[str, str]]:
+    """
+    Big-picture: Read embedded Author, Title, CreationDate and accept them only if they look like real bibliographic data.
+    Inputs: pdf - already-opened PDFium document.
+    Outputs: Dict with keys 'author', 'title', 'pubdate' (year), or None if missing/placeholder/unreadable.
+    Role: Cheap preflight that lets well-tagged PDFs skip text extraction and the LLM call entirely.
+    """
     try:
-        reader = PdfReader(str(pdf_path))
-        if not reader.pages:
+        info = pdf.get_metadata_dict()
+    except Exception:
+        return None
+    author, title, created = (info.get(key, "").strip() for key in ("Author", "Title", "CreationDate"))
+    year = _PDF_DATE_YEAR.match(created)
+    if not year:
+        return None
+    # A false accept here means a bad filename with no LLM fallback, so err on the side of rejecting
+    if _FILENAME_TITLE.search(title) or " " not in author.strip():  # Single-token authors are usually login names
+        return None
+    for value in (author, title):
+        clean = sanitize_filename(value).lower()
+        if len(clean) <= 3 or _JUNK_METADATA.fullmatch(clean):
             return None
-        num_pages = min(len(reader.pages), n)
-        texts = []
-        for i in range(num_pages):
-            page_text = reader.pages[i].extract_text()
-            if page_text:
-                texts.append(page_text.strip())
-        return "\n\n".join(texts) if texts else None
+    return {"author": author, "title": title, "pubdate": year.group(1)}
+
+def prepare_pdf(pdf_path: Path, n: int = 10) -> Tuple[Optional[Dict[str, str]], Optional[str]]:
+    """
+    Big-picture: Gather LLM-free inputs for one PDF: trusted embedded metadata if present, else first-n-pages text.
+    Inputs: pdf_path - Path to PDF file; n - number of pages to extract when metadata is not usable.
+    Outputs: (existing_metadata, extracted_text); at most one is set, both None on failure.
+    Role: Process-pool unit of work; opens (and parses the xref of) each PDF once for both preflight and extraction.
+    """
+    import pypdfium2 as pdfium  # Fast PDF text extraction; imported per worker process
+    try:
+        pdf = pdfium.PdfDocument(str(pdf_path))
+        try:
+            existing = read_existing_metadata(pdf)
+            if existing:
+                return existing, None
+            return None, extract_first_n_pages_text(pdf, n)
+        finally:
+            pdf.close()
     except Exception as e:
         print(f"Failed to extract from {pdf_path.name}: {e}")
-        return None
+        return None, None
 
-def guess_pdf_metadata(llm: Anthropic, prompt_text: str) -> Optional[Dict[str, str]]:
+def is_transient_api_error(exc: BaseException) -> bool:
     """
-    Big-picture: Submit extracted text to Claude, requesting structured JSON metadata.
-    Inputs: llm (Anthropic instance), prompt_text (string from PDF first page)
-    Outputs: Dict with keys 'author', 'title', 'pubdate', or None on error/unreliability.
-    Role: Central "brain" of the pipeline, abstracting LLM operations and filtering unreliable suggestions.
-    """
-    SYSTEM_PROMPT = (
-        "You are an expert librarian specializing in digital knowledge management, renowned for your meticulous approach to naming, organizing, and ensuring the discoverability of electronic resources. In your process, you practice analytical cross-referencing, triangulating key bibliographic details from multiple points within a document (title page, copyright, TOC, citation instructions). Your philosophy is driven by optimally balancing user searchability (discoverability), source traceability (sourceability), and archival order. You bring a systems view: every filename you craft is an intentional node in a vast, navigable digital knowledge ecosystem, shaped to maximize both present retrieval and future relevance."
-        "Upon receiving the first ten pages of raw text from a PDF, your task is to accurately infer and assemble three bibliographic details for effective PDF file naming:"
-        "Title: Extract the complete, official title (including subtitle), prioritizing accuracy and specificity. Cross-check its consistency by locating it on the title page, copyright page, table of contents, and in citation guidance sections."
-        "Author/Institution: Determine the primary institution(s) or lead author(s). Give preference to institutional names over individuals. If multiple institutions are listed, include a maximum of three (joined by \"&\"). For individual authors in journal papers, use the lead author’s name followed by \"etal\" if appropriate."
-        "Year of Publication: Infer the most likely year (including month if present for increased precision), also validated across several mentions in the document."
-        "Structure the filename as: [Institution(s) or Author] - [Full Title] ([Year])"
-        "Example: OECD & MissionLab - Harnessing mission governance to achieve national climate targets (2025)"
-        "Prioritize institutions and specifically use their most recognisable acronyms. Only use individual names if institutions are unclear/not primary."
-        "For single- or dual-author papers, include the full name(s); for three or more authors, use the lead name and \"etal\"."
-        "Month or season in the date is included if available, else use just the year."
-        "Always use an ampersand (&) to separate institutions (max of 3) and 'etal' to indicate multiple authors after only naming one author in the title."
-        "If unclear, suggest author as Various and Title as Unknown."
+    Big-picture: Classify API errors worth retrying: connection failures/timeouts, 408, 409, 429 and 5xx (incl. 529 overloaded).
+    Inputs: exc - exception raised by the Anthropic client.
+    Outputs: True if a retry may succeed.
+    Role: Retry predicate; other 4xx (bad request, auth) would fail the same way again, so they are not retried.
+    """
+    from anthropic import APIConnectionError, APIStatusError  # Already loaded by load_llm()
+    if isinstance(exc, APIConnectionError):  # Includes APITimeoutError
+        return True
+    return isinstance(exc, APIStatusError) and (exc.status_code in (408, 409, 429) or exc.status_code >= 500)
+
+def log_retry(retry_state: RetryCallState) -> None:
+    """
+    Big-picture: Print the failed attempt's exception and the backoff delay before tenacity retries it.
+    Inputs: retry_state - tenacity state for the failing create_message() call.
+    Outputs: None (prints progress).
+    Role: before_sleep hook; makes rate-limit and overload backoff visible instead of looking like a hang.
+    """
+    print(f"LLM call failed ({retry_state.outcome.exception()!r}); "
+          f"retry {retry_state.attempt_number} in {retry_state.next_action.sleep:.1f}s")
+
+@retry(
+    retry=retry_if_exception(is_transient_api_error),
+    wait=wait_random_exponential(multiplier=1, max=60),
+    stop=stop_after_attempt(5),
+    before_sleep=log_retry,
+    reraise=True,
+)
+async def create_message(
+    llm: AsyncAnthropic, sem: asyncio.Semaphore, limiter: RateLimiter, token_estimate: int, **kwargs
+):
+    """
+    Big-picture: Rate-limited, concurrency-bounded llm.messages.create, retried with jittered exponential backoff on transient errors.
+    Inputs: llm (AsyncAnthropic instance), sem (concurrency cap), limiter (token bucket), token_estimate (input + output tokens), kwargs for messages.create.
+    Outputs: Anthropic Message response.
+    Role: Single choke point for all API traffic, so limits hold regardless of how many PDFs run at once.
+    """
+    await limiter.acquire(token_estimate)
+    async with sem:
+        return await llm.messages.create(**kwargs)
+
+def is_well_formed_guess(guessed: object) -> bool:
+    """
+    Big-picture: Check that an LLM answer is a dict whose 'author', 'title' and 'pubdate' are all strings.
+    Inputs: guessed - one entry of the emit_metadata tool input (forced tool use does not strictly enforce the schema).
+    Outputs: True if the entry has the expected shape.
+    Role: Shape gate before caching or renaming, so a null or non-string field can never reach .strip() or a KeyError.
+    """
+    return isinstance(guessed, dict) and all(
+        isinstance(guessed.get(key), str) for key in ("author", "title", "pubdate")
+    )
+
+def is_reliable_guess(guessed: Dict[str, str]) -> bool:
+    """
+    Big-picture: Reject LLM guesses that are malformed, fell back to the "Various"/"Unknown" placeholders, or lack a title.
+    Inputs: guessed - parsed metadata dict (may be a malformed entry cached by an older version).
+    Outputs: True if the guess is usable for renaming.
+    Role: Reliability filter shared by fresh and cached LLM responses.
+    """
+    if not is_well_formed_guess(guessed):
+        return False
+    author, title = guessed["author"].strip().lower(), guessed["title"].strip().lower()
+    return author not in {"unknown", "various"} and title not in {"", "unknown"}
+
+async def guess_pdf_metadata_batch(
+    llm: AsyncAnthropic, items: List[Tuple[int, str]], sem: asyncio.Semaphore, limiter: RateLimiter,
+    cache: Optional[LLMCache] = None,
+) -> Dict[int, Optional[Dict[str, str]]]:
+    """
+    Big-picture: Submit several PDFs' extracted text to Claude in one request, asking for a JSON array of metadata.
+    Inputs: llm (AsyncAnthropic instance), items ((pdf_id, extracted text) pairs), sem/limiter (shared throttles), cache (optional LLMCache)
+    Outputs: Dict pdf_id -> dict with keys 'author', 'title', 'pubdate', or None on error/unreliability.
+    Role: Central "brain" of the pipeline; amortizes round-trips and system-prompt tokens across PDFs and filters unreliable suggestions.
+    """
+    results: Dict[int, Optional[Dict[str, str]]] = {}
+    pending = []  # (pdf_id, input_hash, signature, prompt_text) not answered by the cache
+    for pdf_id, prompt_text in items:
+        input_hash = cache_key(PROMPT_VERSION, prompt_text)
+        signature = None
+        cached = cache.get(input_hash) if cache else None
+        if cached is None and cache:
+            # Near-duplicate text (e.g. another version of the same report) reuses that document's answer
+            signature = text_minhash(prompt_text)
+            cached = cache.get_similar(PROMPT_VERSION, signature)
+        if cached is not None:
+            results[pdf_id] = cached if is_reliable_guess(cached) else None
+        else:
+            pending.append((pdf_id, input_hash, signature, prompt_text))
+    if not pending:
+        return results
+    documents = "\n\n".join(
+        f"Document {n}:\n<<<\n{prompt_text}\n>>>" for n, (*_, prompt_text) in enumerate(pending, 1)
     )
     USER_MSG = (
-        f"Given the following rawtext from the first 10 pages of a PDF, guess probable author, title, and publication year."
-        f"Here are 10 examples of how I want titles to be structured:"
-        f"SpringerOpen - African Handbook of Climate Change Adaptation (2022)"
-        f"GIZ & NCFA & UNEP-FI & Global Canopy & Emerging Markets Dialogu - making FIs more resilient to environmental risks (Apr, 2017)"
-        f"NBER - Adapting To Flood Risk Evidence From A Panel Of Global Cities (2022)"
-        f"Gaby Frangieh - Credit spread risk in the banking book (2025)"
-        f"Banca d'Italia & IMF - Embedding sustainability in credit risk assessment (Mar, 2025)"
-        f"Augusto Blanc-Blocquel etal - Climate-related default probabilities (2024)"
-        f"Misereor - Towards a socio-ecological transformation of the economy (Mar, 2024)"
-        f"Esther Shears etal - How central banks manage climate and energy transition risks (Feb, 2025)"
-        f"OECD & ColumbiaU - Harnessing mission governance to achieve national climate targets (2025)"
-        f"OxfordU - Input for the update of the SBTi corporate net-zero standard (April, 2025)"
-        f"Put simply, your guess should look like this: OrgA & OrgB & Jane Smith - The Document Title- Subtitles (2023)."
-        f"Please output strictly JSON in the following format: {{'author':'', 'title':'', 'pubdate':''}}. "
-        f"----\n{prompt_text}\n----"
+        f"Given the following rawtext from the first pages of {len(pending)} PDF(s), guess probable author, title, and publication year for each."
+        f"Call emit_metadata with exactly {len(pending)} entr{'y' if len(pending) == 1 else 'ies'}, one per document, each tagged with its document number.\n"
+        f"{documents}"
     )
+    max_tokens = MAX_OUTPUT_TOKENS_PER_DOC * len(pending)
+    # Rough token estimate (~4 chars/token) for the tokens/min bucket
+    token_estimate = (len(SYSTEM_PROMPT) + len(USER_MSG)) // 4 + max_tokens
     try:
-        response = llm.messages.create(
+        response = await create_message(
+            llm, sem, limiter, token_estimate,
             model="claude-3-haiku-20240307",
-            max_tokens=1000,
-            system=SYSTEM_PROMPT,
+            max_tokens=max_tokens,
+            system=SYSTEM_BLOCKS,
+            tools=[METADATA_TOOL],
+            tool_choice={"type": "tool", "name": METADATA_TOOL["name"]},
             messages=[{
                 "role": "user",
                 "content": USER_MSG,
             }]
         )
-        content = response.content[0].text
-        # Extract JSON from any codeblock wrapper
-        match = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", content, flags=re.DOTALL)
-        content = match.group(1) if match else content
-        # Remove leading/trailing text outside braces if present
-        # Clean up common LLM output issues for JSON parsing
-        # 1. Remove code block markers
-        content = re.sub(r'^```(?:json)?', '', content.strip(), flags=re.IGNORECASE).strip()
-        content = re.sub(r'```$', '', content.strip()).strip()
-        # 2. Extract JSON object from surrounding text
-        content_match = re.search(r'\{.*\}', content, flags=re.DOTALL)
-        if content_match:
-            content = content_match.group(0)
-        # 3. Replace single quotes with double quotes (only outside of already valid JSON)
-        #    Only do this if double quotes are not already present for keys
-        if '"' not in content:
-            content = content.replace("'", '"')
-        # 4. Remove trailing commas
-        content = re.sub(r',\s*([}\]])', r'\1', content)
-        try:
-            guessed = json.loads(content)
-        except Exception as e2:
-            print(f"LLM error (after cleaning): {e2}\nRaw content: {content}")
-            return None
-        # Reliability check:
-        if (
-            guessed.get("author", "").strip().lower() in {"unknown", "various"}
-            or guessed.get("title", "").strip().lower() == "unknown"
-            or not guessed.get("title", "").strip()
-        ):
-            return None
-        return guessed
-    except (Exception, json.JSONDecodeError) as e:
+        # Forced tool use: the answer arrives as an already-parsed tool_use input, no JSON cleanup needed
+        tool_input = next(block.input for block in response.content if block.type == "tool_use")
+        guesses = tool_input.get("documents")
+    except Exception as e:
         print(f"LLM error: {e}")
-        return None
+        guesses = None
+    # Match answers to files by their document number, never by position: a reordered answer would
+    # otherwise swap two PDFs' names and cache each under the other's hash.
+    by_number = {
+        guessed["document"]: guessed for guessed in guesses
+        if isinstance(guessed, dict) and type(guessed.get("document")) is int  # Not bool, not unhashable
+    } if isinstance(guesses, list) else {}
+    ok = (
+        isinstance(guesses, list) and len(guesses) == len(pending)
+        and set(by_number) == set(range(1, len(pending) + 1))
+    )
+    if not ok:
+        if guesses is not None:
+            print(f"LLM error: expected results for documents 1..{len(pending)}, got {guesses!r}")
+        results.update((pdf_id, None) for pdf_id, *_ in pending)
+        return results
+    for n, (pdf_id, input_hash, signature, _) in enumerate(pending, 1):
+        guessed = by_number[n]
+        if not is_well_formed_guess(guessed):
+            print(f"LLM error: malformed result {guessed!r}")
+            results[pdf_id] = None
+            continue
+        guessed = {key: guessed[key] for key in ("author", "title", "pubdate")}  # The number is batch-specific
+        # Cache the well-formed answer (reliable or not) so identical text is never re-queried
+        if cache:
+            cache.put(input_hash, PROMPT_VERSION, guessed, signature)
+        results[pdf_id] = guessed if is_reliable_guess(guessed) else None
+    return results
+
+async def guess_pdf_metadata(
+    llm: AsyncAnthropic, prompt_text: str, sem: asyncio.Semaphore, limiter: RateLimiter,
+    cache: Optional[LLMCache] = None,
+) -> Optional[Dict[str, str]]:
+    """
+    Big-picture: Submit one PDF's extracted text to Claude, requesting structured JSON metadata.
+    Inputs: llm (AsyncAnthropic instance), prompt_text (string from PDF first pages), sem/limiter (shared throttles), cache (optional LLMCache)
+    Outputs: Dict with keys 'author', 'title', 'pubdate', or None on error/unreliability.
+    Role: Single-document convenience wrapper around guess_pdf_metadata_batch().
+    """
+    return (await guess_pdf_metadata_batch(llm, [(0, prompt_text)], sem, limiter, cache))[0]
 
 def sanitize_filename(raw: str, limit: int = 200) -> str:
     """
@@ -169,10 +465,8 @@ def sanitize_filename(raw: str, limit: int = 200) -> str:
     Outputs: cleaned, truncated string.
     Role: Prevents OS errors, improves human readability in filenames.
     """
-    # Accept: letters, numbers, underscores, hyphens, spaces, (), &
-    cleaned = re.sub(r"[^\w\s\(\)\-\&]", "", raw)
-    cleaned = re.sub(r"\s+", " ", cleaned).strip()
-    return cleaned[:limit]
+    # Accept: letters, numbers, underscores, hyphens, spaces, (), &; split/join collapses and strips whitespace
+    return " ".join(raw.translate(_FILENAME_CHARS).split())[:limit]
 
 def make_destination_path(base_dir: Path, proposed: str) -> Path:
     """
@@ -197,75 +491,170 @@ def update_and_save_pdf_metadata(
     src_pdf: Path, dest_pdf: Path, author: str, title: str, date_str: str
 ) -> bool:
     """
-    Big-picture: Copy PDF, update XMP/document metadata, save as dest_pdf.
-    Inputs: src_pdf (source path), dest_pdf (target), author/title (metadata), date_str (year)
+    Big-picture: Update document info metadata of src_pdf in place with pikepdf, then rename it to dest_pdf.
+    Inputs: src_pdf (source path), dest_pdf (target, same directory), author/title (metadata), date_str (year)
     Outputs: True if successful, False on failure.
     Role: Ensures both correct filename and internal PDF metadata for archival integrity.
     """
+    import pikepdf  # PDF metadata writing
     try:
-        reader = PdfReader(str(src_pdf))
-        writer = PdfWriter()
-        for page in reader.pages:
-            writer.add_page(page)
         year_candidate = str(date_str)
-        metadata = {
-            "/Author": author,
-            "/Title": title,
-            "/CreationDate": f"D:{year_candidate}0101000000Z"
-        }
-        writer.add_metadata(metadata)
-        # Write to a safe temp, then move
-        temp_path = dest_pdf.parent / (dest_pdf.name + ".tmp")
-        with open(temp_path, "wb") as out_f:
-            writer.write(out_f)
-        temp_path.replace(dest_pdf)
+        # QPDF copies page objects and streams as-is; only /Info changes, no per-page Python work.
+        # Overwriting the input is atomic in pikepdf (temp file + replace), so a failed save leaves src_pdf intact.
+        with pikepdf.open(src_pdf, allow_overwriting_input=True) as pdf:
+            pdf.docinfo["/Author"] = author
+            pdf.docinfo["/Title"] = title
+            pdf.docinfo["/CreationDate"] = f"D:{year_candidate}0101000000Z"
+            pdf.save(src_pdf, linearize=False)
+        # Same directory, so a single atomic rename; no copy and no separate unlink of the original
+        src_pdf.rename(dest_pdf)
         return True
     except Exception as e:
         print(f"Error updating/writing PDF ({src_pdf.name}): {e}")
         return False
 
-def process_single_pdf(
-    pdf_path: Path, llm: Anthropic
-) -> Optional[Path]:
+def rename_pdf(pdf_path: Path, guessed: Dict[str, str], write_metadata: bool = True) -> Path:
     """
-    Big-picture: For a single PDF, extract, AI-infer metadata, attempt rename and metadata write.
-    Inputs: pdf_path - PDF file; llm - Anthropic instance
+    Big-picture: Rename a PDF to "Author - Title (Year)", writing that metadata into the file unless it is already embedded.
+    Inputs: pdf_path - PDF file; guessed - dict with 'author', 'title', 'pubdate'; write_metadata - False for embedded metadata.
     Outputs: Path to the new PDF file on success (or original path if unchanged/fail)
-    Role: Unit of work for workflow; enables granular testing and extension (e.g., dry-run mode).
+    Role: Final, side-effecting step for one PDF; never overwrites existing files.
     """
-    extracted = extract_first_n_pages_text(pdf_path, n=10)
-    if not extracted:
-        print(f"Skipping {pdf_path.name}: no text found.")
-        return pdf_path
-    guessed = guess_pdf_metadata(llm, extracted)
-    if not guessed:
-        print(f"Skipping {pdf_path.name}: LLM metadata guess failed or unreliable.")
+    # Re-runs: a file already carrying this name (possibly with a _N suffix) is left alone on both paths,
+    # so it is not renamed to "..._1.pdf" and rewritten every run
+    if pdf_path.stem.startswith(sanitize_filename(f"{guessed['author']} - {guessed['title']}")):
+        print(f"Skipping {pdf_path.name}: already named from its metadata.")
         return pdf_path
+    if not write_metadata:
+        # Metadata is already embedded: rename only, no metadata rewrite
+        clean_file = sanitize_filename(f"{guessed['author']} - {guessed['title']} ({guessed['pubdate']})")
+        new_path = make_destination_path(pdf_path.parent, clean_file)
+        try:
+            pdf_path.rename(new_path)
+        except OSError as e:
+            print(f"Failed to rename '{pdf_path.name}': {e}")
+            return pdf_path
+        print(f"Renamed '{pdf_path.name}' → '{new_path.name}' (from embedded metadata)")
+        return new_path
     candidate_name = f"{guessed['author']} - {guessed['title']} ({guessed['pubdate']})"
     clean_file = sanitize_filename(candidate_name)
     new_path = make_destination_path(pdf_path.parent, clean_file)
     # Attempt to update metadata and rename atomically
     if update_and_save_pdf_metadata(pdf_path, new_path, sanitize_filename(guessed['author']),
                                     sanitize_filename(guessed['title']), guessed['pubdate']):
-        # (Safety: Optionally, backup original instead of deleting/moving)
-        pdf_path.unlink(missing_ok=True)
         print(f"Renamed '{pdf_path.name}' → '{new_path.name}'")
         return new_path
     else:
         print(f"Failed to process '{pdf_path.name}': metadata/write error.")
         return pdf_path
 
-def process_pdf_directory(directory: Path, llm: Anthropic):
+async def process_pdf_batch(
+    items: List[Tuple[Path, Optional[Dict[str, str]], Optional[str]]], llm: AsyncAnthropic,
+    sem: asyncio.Semaphore, limiter: RateLimiter, cache: Optional[LLMCache] = None,
+) -> List[Path]:
+    """
+    Big-picture: For a batch of prepared PDFs, rename those with trusted embedded metadata, AI-infer the rest in one LLM request, then rename and write metadata.
+    Inputs: items - (pdf_path, existing, extracted) tuples from prepare_pdf(); llm - AsyncAnthropic instance; sem/limiter - shared throttles; cache - optional LLMCache
+    Outputs: Path per item, in input order: the new PDF path on success (or original path if unchanged/fail)
+    Role: Unit of work for workflow; enables granular testing and extension (e.g., dry-run mode).
+    """
+    to_guess = [(i, extracted) for i, (_, existing, extracted) in enumerate(items) if not existing and extracted]
+    guesses = await guess_pdf_metadata_batch(llm, to_guess, sem, limiter, cache) if to_guess else {}
+    # No await from here on, so concurrent batches cannot claim the same destination path.
+    results = []
+    for i, (pdf_path, existing, extracted) in enumerate(items):
+        if existing:
+            results.append(rename_pdf(pdf_path, existing, write_metadata=False))
+        elif not extracted:
+            print(f"Skipping {pdf_path.name}: no text found.")
+            results.append(pdf_path)
+        elif not guesses.get(i):
+            print(f"Skipping {pdf_path.name}: LLM metadata guess failed or unreliable.")
+            results.append(pdf_path)
+        else:
+            results.append(rename_pdf(pdf_path, guesses[i]))
+    return results
+
+async def process_single_pdf(
+    pdf_path: Path, existing: Optional[Dict[str, str]], extracted: Optional[str], llm: AsyncAnthropic,
+    sem: asyncio.Semaphore, limiter: RateLimiter, cache: Optional[LLMCache] = None,
+) -> Path:
     """
-    Big-picture: For all PDFs in directory, apply process_single_pdf() in sorted, recent-first order.
-    Inputs: directory (Path), llm (Anthropic instance)
+    Big-picture: Process one prepared PDF (a batch of one).
+    Inputs: pdf_path - PDF file; existing/extracted - results of prepare_pdf(); llm - AsyncAnthropic instance; sem/limiter - shared throttles; cache - optional LLMCache
+    Outputs: Path to the new PDF file on success (or original path if unchanged/fail)
+    Role: Single-file entrypoint for scripting and testing.
+    """
+    return (await process_pdf_batch([(pdf_path, existing, extracted)], llm, sem, limiter, cache))[0]
+
+async def process_pdf_directory(directory: Path, llm: AsyncAnthropic):
+    """
+    Big-picture: For all PDFs in directory (recent-first), extract text in a process pool and feed batches of it to concurrent process_pdf_batch() workers.
+    Inputs: directory (Path), llm (AsyncAnthropic instance)
     Outputs: None (prints progress).
-    Role: Batch driver for workflow; entrypoint for CLI, scripting, or extension.
+    Role: Batch driver for workflow; pipelines CPU-bound extraction with network-bound LLM calls so the two overlap.
     """
-    pdfs = sorted((f for f in directory.iterdir() if f.suffix.lower() == ".pdf" and f.is_file()),
-                  key=lambda p: p.stat().st_mtime, reverse=True)
-    for pdf_path in pdfs:
-        process_single_pdf(pdf_path, llm)
+    # scandir's DirEntry caches file type (and stat on some OSes), avoiding a syscall per check
+    with os.scandir(directory) as it:
+        entries = [e for e in it if e.name.lower().endswith(".pdf") and e.is_file()]
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    pdfs = [Path(e.path) for e in entries]
+    sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    limiter = RateLimiter(MAX_REQUESTS_PER_MINUTE, MAX_TOKENS_PER_MINUTE)
+    queue: asyncio.Queue = asyncio.Queue()  # (pdf_path, existing, extracted) items; None tells a worker to stop
+    loop = asyncio.get_running_loop()
+    cache = LLMCache()
+
+    async def extract(extractor: ProcessPoolExecutor, pdf_path: Path) -> None:
+        """
+        Big-picture: Run prepare_pdf() for one PDF in the process pool and queue the result.
+        Inputs: extractor - shared ProcessPoolExecutor; pdf_path - PDF file.
+        Outputs: None (puts (pdf_path, existing, extracted) on the queue; nothing if the worker process failed).
+        Role: Producer side of the pipeline; keeps CPU-bound parsing off the event loop.
+        """
+        try:
+            existing, extracted = await loop.run_in_executor(extractor, prepare_pdf, pdf_path, 10)
+        except Exception as e:
+            print(f"Failed to extract from {pdf_path.name}: {e}")
+            return
+        await queue.put((pdf_path, existing, extracted))
+
+    async def llm_worker() -> None:
+        """
+        Big-picture: Take prepared PDFs off the queue in batches and hand each batch to process_pdf_batch().
+        Inputs: None (reads the shared queue; a None item means stop).
+        Outputs: None (prints progress and per-batch failures).
+        Role: Consumer side of the pipeline; batches whatever extraction has finished, so calls start as soon as text exists.
+        """
+        done = False
+        while not done and (item := await queue.get()) is not None:
+            batch = [item]
+            batch_tokens = len(item[2] or "") // 4
+            # Drain whatever extraction has already finished, up to the batch limits (assuming a full-size next item)
+            while len(batch) < MAX_BATCH_SIZE and batch_tokens + MAX_PROMPT_CHARS // 4 <= MAX_BATCH_INPUT_TOKENS:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is None:
+                    done = True
+                    break
+                batch.append(item)
+                batch_tokens += len(item[2] or "") // 4
+            try:
+                await process_pdf_batch(batch, llm, sem, limiter, cache)
+            except Exception as e:
+                print(f"Failed to process {', '.join(repr(p.name) for p, _, _ in batch)}: {e}")
+
+    try:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as extractor:
+            workers = [asyncio.create_task(llm_worker()) for _ in range(MAX_CONCURRENT_REQUESTS)]
+            await asyncio.gather(*(extract(extractor, p) for p in pdfs))
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+    finally:
+        cache.close()
     print("Finished processing all PDFs!")
 
 def main():
@@ -284,7 +673,7 @@ def main():
         print(f"Invalid directory: {directory}")
         return
     llm = load_llm()
-    process_pdf_directory(directory, llm)
+    asyncio.run(process_pdf_directory(directory, llm))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,152 @@
+########### PYTHON
+# Script Title: LLM Metadata Cache
+# Script Description: Persistent cache for Claude metadata guesses, keyed by a SHA-256 of prompt version + extracted PDF text, with a MinHash LSH index for near-duplicate text. Lets re-runs over the same (or nearly the same) PDFs skip the LLM round-trip entirely.
+# Script Author: myPyAI + Naveen Srivatsav
+# Last Updated: 20261014
+###########
+
+from __future__ import annotations  # Allows the lazily imported LeanMinHash in type hints
+import json  # Standard: Serializing cached responses
+import time  # Standard: Entry timestamps
+import sqlite3  # Standard: Local persistent store
+import hashlib  # Standard: Content hashing
+from pathlib import Path  # Standard: Cache location
+from typing import TYPE_CHECKING, Optional, Dict  # Standard: Type hints
+
+# Third-party: datasketch (near-duplicate detection) pulls in numpy/scipy, so it is imported on first use
+if TYPE_CHECKING:
+    from datasketch import LeanMinHash
+
+DEFAULT_CACHE_PATH = Path.home() / ".pdf_renamer" / "cache.db"
+
+# Near-duplicate settings: Jaccard similarity of character 5-gram shingles. 0.9 is deliberately strict,
+# since a hit must mean "same author/title", not just "same topic".
+SIMILARITY_THRESHOLD = 0.9
+NUM_PERM = 128
+SHINGLE_SIZE = 5
+
+def cache_key(prompt_version: str, prompt_text: str) -> str:
+    """
+    Big-picture: Hash prompt version + extracted text into a stable cache key.
+    Inputs: prompt_version - version tag of the prompt; prompt_text - text sent to the LLM.
+    Outputs: Hex SHA-256 digest.
+    Role: Identical text under the same prompt maps to one entry; bumping the version invalidates old entries.
+    """
+    return hashlib.sha256(f"{prompt_version}\n{prompt_text}".encode()).hexdigest()
+
+def text_minhash(prompt_text: str) -> LeanMinHash:
+    """
+    Big-picture: MinHash signature of the text's character shingles (case- and whitespace-insensitive).
+    Inputs: prompt_text - text sent to the LLM.
+    Outputs: LeanMinHash signature.
+    Role: Similarity key for near-duplicate lookups (e.g. v1 vs v2 of the same paper).
+    """
+    from datasketch import MinHash, LeanMinHash
+    text = " ".join(prompt_text.lower().split())
+    shingles = {text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+    minhash = MinHash(num_perm=NUM_PERM)
+    minhash.update_batch([shingle.encode() for shingle in shingles])
+    return LeanMinHash(minhash)
+
+class LLMCache:
+    """
+    Big-picture: SQLite-backed map from input hash to the parsed LLM JSON response, plus per-prompt-version MinHash LSH indexes.
+    Inputs: path - database file (created along with its parent directory if missing).
+    Outputs: get()/get_similar()/put() of response dicts.
+    Role: Exact-match and near-duplicate short-circuit in front of the LLM call.
+    """
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "input_hash TEXT PRIMARY KEY, prompt_version TEXT, response_json TEXT, created_at INT, minhash BLOB)"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(llm_cache)")}
+        if "minhash" not in columns:  # Databases created before near-duplicate lookups existed
+            self.conn.execute("ALTER TABLE llm_cache ADD COLUMN minhash BLOB")
+        self.conn.commit()
+        # prompt_version -> (LSH index, input_hash -> signature); built lazily from the DB on first lookup
+        self._indexes: Dict[str, tuple] = {}
+
+    def _index(self, prompt_version: str) -> tuple:
+        """
+        Big-picture: Return the MinHash LSH index for one prompt version, building it from stored signatures on first use.
+        Inputs: prompt_version - version tag whose entries should be searchable.
+        Outputs: (MinHashLSH index, dict input_hash -> LeanMinHash signature).
+        Role: Keeps near-duplicate lookups in memory and scoped to one prompt version; runs that never miss the exact cache never pay for it.
+        """
+        if prompt_version not in self._indexes:
+            from datasketch import MinHashLSH, LeanMinHash
+            lsh = MinHashLSH(threshold=SIMILARITY_THRESHOLD, num_perm=NUM_PERM)
+            signatures = {}
+            rows = self.conn.execute(
+                "SELECT input_hash, minhash FROM llm_cache WHERE prompt_version = ? AND minhash IS NOT NULL",
+                (prompt_version,),
+            )
+            for input_hash, blob in rows:
+                signatures[input_hash] = LeanMinHash.deserialize(blob)
+                lsh.insert(input_hash, signatures[input_hash])
+            self._indexes[prompt_version] = (lsh, signatures)
+        return self._indexes[prompt_version]
+
+    def get(self, input_hash: str) -> Optional[Dict[str, str]]:
+        """
+        Big-picture: Exact-match lookup of a cached LLM response.
+        Inputs: input_hash - key from cache_key().
+        Outputs: Parsed response dict, or None on a miss.
+        Role: First, cheapest check before any near-duplicate search or API call.
+        """
+        row = self.conn.execute(
+            "SELECT response_json FROM llm_cache WHERE input_hash = ?", (input_hash,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_similar(self, prompt_version: str, signature: LeanMinHash) -> Optional[Dict[str, str]]:
+        """
+        Big-picture: Find the cached response whose text signature is most similar to this one.
+        Inputs: prompt_version - only entries under this version are considered; signature - text_minhash() of the new text.
+        Outputs: Parsed response dict of the best match with estimated Jaccard >= SIMILARITY_THRESHOLD, or None.
+        Role: Near-duplicate short-circuit (e.g. a revised edition of a cached report) after an exact-match miss.
+        """
+        lsh, signatures = self._index(prompt_version)
+        # LSH candidates are approximate; confirm with the estimated Jaccard similarity
+        scored = [(signature.jaccard(signatures[key]), key) for key in lsh.query(signature)]
+        scored = [(score, key) for score, key in scored if score >= SIMILARITY_THRESHOLD]
+        return self.get(max(scored)[1]) if scored else None
+
+    def put(
+        self, input_hash: str, prompt_version: str, response: Dict[str, str],
+        signature: Optional[LeanMinHash] = None,
+    ) -> None:
+        """
+        Big-picture: Store (or replace) one LLM response, with its MinHash signature if given.
+        Inputs: input_hash - key from cache_key(); prompt_version - version tag; response - parsed response dict; signature - optional text_minhash().
+        Outputs: None (committed to SQLite immediately).
+        Role: Persists answers across runs and keeps an already-built LSH index in sync with the database.
+        """
+        blob = None
+        if signature is not None:
+            blob = bytearray(signature.bytesize())
+            signature.serialize(blob)
+            blob = bytes(blob)
+            if prompt_version in self._indexes:
+                lsh, signatures = self._indexes[prompt_version]
+                if input_hash not in lsh:
+                    lsh.insert(input_hash, signature)
+                signatures[input_hash] = signature
+        self.conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (input_hash, prompt_version, response_json, created_at, minhash) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (input_hash, prompt_version, json.dumps(response), int(time.time()), blob),
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        """
+        Big-picture: Close the SQLite connection.
+        Inputs: None.
+        Outputs: None.
+        Role: Called once by the directory driver when a run finishes.
+        """
+        self.conn.close()